@@ -1,37 +1,119 @@
-from flask import Flask, render_template, redirect, url_for, Response, jsonify, request
+from flask import Flask, render_template, redirect, url_for, Response, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+import os
+import sys
 import json
+import sqlite3
 from pathlib import Path
-import io
 import csv
 from datetime import datetime
 import threading
 import time
-
+import queue
+import heapq
+from operator import itemgetter
+from collections import Counter, namedtuple
+from itertools import compress
+from functools import lru_cache
+
+import orjson
 import paho.mqtt.client as mqtt
+from sqlalchemy import event, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
+
+from rule_engine import evaluate_event, evaluate_events, preload_mappings
+from models import db, Device, Event, Incident, ComplianceMapping, bulk_insert_events, SQLITE_HAS_RETURNING
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify()/tojson backed by orjson. Like the default provider it sorts
+    keys, sends dates through the default hook and indents by 2 when asked.
+    Unlike it, non-ASCII text (e.g. "°C") is sent as raw UTF-8 rather than
+    \\u escapes, and NaN/Infinity are written as null.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return loads_json(s)
+
+
+def loads_json(text):
+    """
+    orjson.loads, falling back to the stdlib parser for the NaN/Infinity
+    literals orjson rejects; older rows were written by json.dumps and can
+    contain them.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
 
-from rule_engine import evaluate_event
-from models import db, Device, Event, Incident
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # --- SQLite configuration ---
 BASE_DIR = Path(__file__).parent
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR / 'grsee.db'}"
+# GRSEE_DATABASE_URI points the app at another DB (e.g. a throwaway one in tests)
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "GRSEE_DATABASE_URI", f"sqlite:///{BASE_DIR / 'grsee.db'}"
+)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": 10, "max_overflow": 20}
 
 db.init_app(app)
 
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the MQTT writer and dashboard readers run without blocking
+    # each other; NORMAL sync is safe under WAL and skips an fsync per commit.
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 THRESHOLD = 90.0  # zone threshold
+SEVERITY_LEVELS = ("low", "medium", "high", "critical")
+HIGH_SEVERITIES = frozenset(("high", "critical"))
+API_EVENTS_MAX_LIMIT = 1000
+CATEGORICAL_FIELDS = ("severity", "event_type", "zone", "device_type")
 
 # --- MQTT configuration (minimal simulation) ---
 MQTT_BROKER_HOST = "127.0.0.1"
 MQTT_BROKER_PORT = 1883
 MQTT_TOPIC = "grsee/events"
 ENABLE_MQTT = True
+MQTT_BATCH_SIZE = 100   # max messages per ingest transaction
+MQTT_BATCH_WAIT = 0.2   # seconds to wait for a batch to fill
+MQTT_QUEUE_MAX = 10_000  # raw payloads buffered before on_message blocks
+
+# Raw MQTT payloads waiting for the ingest worker
+_ingest_queue = queue.Queue(maxsize=MQTT_QUEUE_MAX)
 
 # -----------------------
 # DB helpers
 # -----------------------
+@lru_cache(maxsize=10000)
+def _loads_cached(json_text):
+    # Rows do not change after insert, so the same text always decodes to the
+    # same object; callers must treat the result as read-only.
+    return loads_json(json_text)
+
+
 def event_to_dict(e: Event):
     return {
         "event_id": e.event_id,
@@ -41,59 +123,349 @@ def event_to_dict(e: Event):
         "event_type": e.event_type,
         "severity": e.severity,
         "summary": e.summary,
-        "payload": json.loads(e.payload_json) if e.payload_json else None
+        "payload": _loads_cached(e.payload_json) if e.payload_json else None
+    }
+
+
+def verdict_to_columns(result):
+    """Flatten an evaluate_event() result into the Event verdict columns."""
+    incident = result["incident"]
+    return {
+        "is_violation": result["policy_result"]["is_violation"],
+        "policy_name": result["policy_result"]["policy_name"],
+        "reason": result["policy_result"]["reason"],
+        "incident_type": incident["incident_type"] if incident["create_incident"] else None,
+        "compliance_mapping_json": orjson.dumps(result["compliance_mapping"]).decode()
     }
 
 
-def get_events_source():
+def verdict_from_columns(row):
     """
-    Prefer DB if it has events. If DB is empty:
-    - If USE_JSON_FALLBACK is True, load mock events from JSON.
-    - Otherwise return an empty list (clean slate).
+    Rebuild an evaluate_event()-shaped result from an Event row (or a row
+    with the same verdict columns). Returns None for rows stored before the
+    verdict columns existed.
     """
-    db_events = Event.query.order_by(Event.timestamp.desc()).all()
-    if db_events:
-        return [event_to_dict(e) for e in db_events]
-    return []
+    if row.is_violation is None:
+        return None
+    return {
+        "policy_result": {
+            "is_violation": row.is_violation,
+            "policy_name": row.policy_name,
+            "reason": row.reason
+        },
+        "compliance_mapping": _loads_cached(row.compliance_mapping_json),
+        "incident": {
+            "create_incident": row.incident_type is not None,
+            "incident_type": row.incident_type
+        }
+    }
 
 
+def get_events_slim():
+    """
+    DB event rows (newest first) without payload_json: the event fields plus
+    the primary key and stored verdict columns.
+    Enough for stats, zone rows, violations and the events table; only
+    event_to_dict() callers need the decoded payload.
+    """
+    return (
+        db.session.query(
+            Event.id,
+            Event.event_id,
+            Event.timestamp,
+            Event.device_type,
+            Event.zone,
+            Event.event_type,
+            Event.severity,
+            Event.summary,
+            Event.is_violation,
+            Event.policy_name,
+            Event.reason,
+            Event.incident_type,
+            Event.compliance_mapping_json
+        )
+        .order_by(Event.timestamp.desc())
+        .all()
+    )
 
-def compute_dashboard_stats(events):
-    total = len(events)
 
-    severity_counts = {"low": 0, "medium": 0, "high": 0, "critical": 0}
-    for e in events:
-        sev = (e.get("severity") or "").strip().lower()
-        if sev in severity_counts:
-            severity_counts[sev] += 1
+def migrate_db():
+    """
+    Bring an existing grsee.db up to the current models.
+    db.create_all() only creates missing tables, so columns and indexes added
+    to existing tables since the DB was created are added here, then events
+    stored before the verdict columns existed get their verdict backfilled.
+    Idempotent: only what is missing is added or backfilled.
+    Returns (names of the columns added, number of verdicts backfilled).
+    """
+    added = []
+    with db.engine.begin() as conn:
+        for table in (Event.__table__, Incident.__table__):
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                type_sql = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {type_sql}")
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added, backfill_event_verdicts()
+
+
+def backfill_event_verdicts(chunk_size=500):
+    """
+    Evaluate and store the verdict for events with a NULL is_violation, on
+    the stored payload like ingest does. Rows the rules can't evaluate are
+    logged and left NULL (they are evaluated on read). Returns the number of
+    rows updated.
+    """
+    updated = 0
+    last_pk = 0
+    while True:
+        rows = (
+            db.session.query(
+                Event.id,
+                Event.event_id,
+                Event.timestamp,
+                Event.device_type,
+                Event.zone,
+                Event.event_type,
+                Event.severity,
+                Event.summary,
+                Event.payload_json
+            )
+            .filter(Event.is_violation.is_(None), Event.id > last_pk)
+            .order_by(Event.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            break
+        last_pk = rows[-1].id
+
+        values = []
+        for row in rows:
+            try:
+                e = loads_json(row.payload_json) if row.payload_json else None
+                if not isinstance(e, dict):
+                    e = row._asdict()
+                values.append({"id": row.id, **verdict_to_columns(evaluate_event(e))})
+            except Exception as ex:
+                print(f"[DB] Could not backfill verdict for event {row.event_id!r}: {ex}")
+        if values:
+            # ORM bulk UPDATE by primary key: one executemany per chunk
+            db.session.execute(update(Event), values)
+            updated += len(values)
 
-    event_type_counts = {}
-    for e in events:
-        t = e.get("event_type", "UNKNOWN")
-        event_type_counts[t] = event_type_counts.get(t, 0) + 1
+    db.session.commit()
+    if updated:
+        invalidate_events_cache()
+    return updated
 
-    zone_counts = {}
-    for e in events:
-        z = e.get("zone", "UNKNOWN")
-        zone_counts[z] = zone_counts.get(z, 0) + 1
 
-    high_alerts = [e for e in events if (e.get("severity", "").lower() in ["high", "critical"])]
-    high_alerts = sorted(high_alerts, key=lambda e: e.get("timestamp", ""), reverse=True)[:5]
+def get_payloads(pks):
+    """
+    {Event.id: decoded payload} for the given primary keys.
+    Lets snapshot views add payloads for the few rows they return without
+    loading payload_json for every event; chunked to stay under SQLite's
+    bound-parameter limit.
+    """
+    pks = list(pks)
+    payloads = {}
+    for start in range(0, len(pks), 500):
+        rows = (
+            db.session.query(Event.id, Event.payload_json)
+            .filter(Event.id.in_(pks[start:start + 500]))
+        )
+        for pk, payload_json in rows:
+            payloads[pk] = _loads_cached(payload_json) if payload_json else None
+    return payloads
 
-    violations_count = 0
-    compliant_count = 0
 
-    for e in events:
-        result = evaluate_event(e)
-        if result["policy_result"]["is_violation"]:
-            violations_count += 1
-        else:
-            compliant_count += 1
+def with_payloads(events, pks):
+    """Copies of the snapshot event dicts with their "payload" added."""
+    payloads = get_payloads(pks)
+    return [{**e, "payload": payloads.get(pk)} for e, pk in zip(events, pks)]
+
+
+def get_events_source_limited(limit, offset=0):
+    """
+    One page of DB events (newest first), with LIMIT/OFFSET done in SQL
+    rather than slicing the full events list.
+    """
+    db_events = (
+        Event.query
+        .order_by(Event.timestamp.desc())
+        .limit(limit)
+        .offset(offset)
+        .all()
+    )
+    return [event_to_dict(e) for e in db_events]
+
+
+# -----------------------
+# Events cache
+# -----------------------
+# Every read route starts from the full events list, so keep the last snapshot
+# in memory and only go back to the DB after a write bumps the version.
+#
+# The snapshot keeps the event dicts (for templates/JSON) plus parallel
+# per-field columns, so aggregations run over flat lists instead of doing
+# dict lookups on every row. pks are the Event primary keys, severities hold
+# the normalized (lower-case) value, results/is_violation come from the rule
+# engine.
+EventStore = namedtuple(
+    "EventStore",
+    "events pks severities zones event_types results is_violation"
+)
+
+_events_version = 0
+_events_cache = None  # (version, store, views)
+_events_lock = threading.Lock()
+
+
+def invalidate_events_cache():
+    global _events_version
+    with _events_lock:
+        _events_version += 1
+
+
+@lru_cache(maxsize=64)
+def normalize_severity(value):
+    """
+    Lower-case, stripped, interned severity.
+    Only a handful of distinct raw values exist, so each is normalized once
+    instead of running strip().lower() on every row of every snapshot.
+    """
+    return sys.intern((value or "").strip().lower())
+
+
+def build_event_store(rows):
+    events = []
+    pks = []
+    results = []
+    pending = []  # indexes of rows stored without a verdict
+    for row in rows:
+        e = {
+            "event_id": row.event_id,
+            "timestamp": row.timestamp,
+            "device_type": row.device_type,
+            "zone": row.zone,
+            "event_type": row.event_type,
+            "severity": row.severity,
+            "summary": row.summary
+        }
+        # Categorical fields repeat a handful of values across every row;
+        # intern them so the snapshot shares one string each and dict/Counter
+        # lookups can short-circuit on identity.
+        for key in CATEGORICAL_FIELDS:
+            e[key] = sys.intern(e[key])
+
+        result = verdict_from_columns(row)
+        if result is None:
+            pending.append(len(events))
+        events.append(e)
+        pks.append(row.id)
+        results.append(result)
+
+    # Older rows have no stored verdict; evaluate just those, on the full
+    # stored message like ingest does (the rules read payload-only fields
+    # such as denied_attempts and temperature)
+    if pending:
+        payloads = get_payloads(pks[i] for i in pending)
+        to_evaluate = [payloads.get(pks[i]) or events[i] for i in pending]
+        for i, result in zip(pending, evaluate_events(to_evaluate)):
+            results[i] = result
+
+    return EventStore(
+        events=events,
+        pks=pks,
+        severities=[normalize_severity(e["severity"]) for e in events],
+        zones=[e["zone"] for e in events],
+        event_types=[e["event_type"] for e in events],
+        results=results,
+        is_violation=[r["policy_result"]["is_violation"] for r in results]
+    )
+
+
+def _get_events_snapshot():
+    global _events_cache
+    version = _events_version
+    cached = _events_cache
+    if cached is not None and cached[0] == version:
+        return cached
+
+    _events_cache = (version, build_event_store(get_events_slim()), {})
+    return _events_cache
+
+
+def get_event_store():
+    """
+    Return the EventStore for the DB events (newest first).
+    Cached until the next write, so callers must not mutate it.
+
+    Callers rely on the newest-first order and do not re-sort by timestamp.
+    """
+    return _get_events_snapshot()[1]
+
+
+def get_snapshot_view(name, build):
+    """
+    Return build(store) for the current events snapshot.
+    Computed once per snapshot, so read-only routes share the same result.
+    """
+    _, store, views = _get_events_snapshot()
+    view = views.get(name)
+    if view is None:
+        view = views[name] = build(store)
+    return view
+
+
+def _ts_key(e):
+    """
+    Sort key for event timestamps.
+    Timestamps are fixed-width "YYYY-MM-DD HH:MM:SS" strings, so plain string
+    comparison is chronological order; do not parse them into datetimes here.
+    """
+    return e.get("timestamp") or ""
+
+
+def compute_dashboard_stats(store, with_zone_breakdown=False):
+    """
+    Dashboard counters for the snapshot.
+    With with_zone_breakdown=True, returns (stats, zone_breakdown) where
+    zone_breakdown is {zone: {"total": N, "violations": M}}, built from the
+    same zone counts so build_zone_rows() does not walk the events again.
+    """
+    total = len(store.events)
+
+    event_type_counts = dict(Counter(store.event_types))
+    zone_counts = dict(Counter(store.zones))
+
+    severity_totals = Counter(store.severities)
+    severity_counts = {sev: severity_totals[sev] for sev in SEVERITY_LEVELS}
+
+    top_alerts = heapq.nlargest(
+        5,
+        (
+            (e, pk) for e, pk, sev in zip(store.events, store.pks, store.severities)
+            if sev in HIGH_SEVERITIES
+        ),
+        key=lambda pair: _ts_key(pair[0])
+    )
+    high_alerts = with_payloads(
+        [e for e, _ in top_alerts],
+        [pk for _, pk in top_alerts]
+    )
+
+    violations_count = sum(store.is_violation)
+    compliant_count = total - violations_count
 
     compliance_percent = round((compliant_count / total) * 100, 1) if total > 0 else 0.0
     violation_percent = round((violations_count / total) * 100, 1) if total > 0 else 0.0
 
-    return {
+    stats = {
         "total": total,
         "severity_counts": severity_counts,
         "event_type_counts": event_type_counts,
@@ -104,20 +476,22 @@ def compute_dashboard_stats(events):
         "compliance_percent": compliance_percent,
         "violation_percent": violation_percent
     }
+    if not with_zone_breakdown:
+        return stats
 
+    zone_violations = Counter(compress(store.zones, store.is_violation))
+    zone_breakdown = {
+        zone: {"total": count, "violations": zone_violations[zone]}
+        for zone, count in zone_counts.items()
+    }
+    return stats, zone_breakdown
 
-def build_zone_rows(events, threshold=THRESHOLD):
-    zone_breakdown = {}
 
-    for e in events:
-        zone = e.get("zone", "UNKNOWN")
-        zone_breakdown.setdefault(zone, {"total": 0, "violations": 0})
-        zone_breakdown[zone]["total"] += 1
+def compute_dashboard_view(store):
+    return compute_dashboard_stats(store, with_zone_breakdown=True)
 
-        result = evaluate_event(e)
-        if result["policy_result"]["is_violation"]:
-            zone_breakdown[zone]["violations"] += 1
 
+def build_zone_rows(zone_breakdown, threshold=THRESHOLD):
     zone_rows = []
     for zone, counts in zone_breakdown.items():
         total = counts["total"]
@@ -136,61 +510,83 @@ def build_zone_rows(events, threshold=THRESHOLD):
     return sorted(zone_rows, key=lambda r: r["compliance_percent"])
 
 
-def build_violations_list(events):
-    violations = []
-    for e in events:
-        proc = evaluate_event(e)
-        if proc["policy_result"]["is_violation"]:
-            violations.append({"raw": e, "proc": proc})
-    return sorted(violations, key=lambda v: v["raw"].get("timestamp", ""), reverse=True)
+def build_violations_list(store):
+    # events are already newest first, so the filtered list is too
+    indexes = list(compress(range(len(store.events)), store.is_violation))
+    # API consumers read denied_attempts/temperature from the payload
+    events = with_payloads(
+        [store.events[i] for i in indexes],
+        [store.pks[i] for i in indexes]
+    )
+    return [
+        {"raw": e, "proc": store.results[i]}
+        for e, i in zip(events, indexes)
+    ]
 
 
 # -----------------------
-# Incident auto-creation
+# Compliance mappings
 # -----------------------
-def sync_incidents_from_events():
+def load_compliance_mappings():
     """
-    Auto-create incidents in DB for any DB events that are violations.
-    Safe to call multiple times (no duplicates).
-    Only runs when events are coming from the database.
+    Merge the compliance_mappings table over the rule engine's built-in
+    mappings (see preload_mappings); an empty table leaves the built-ins.
     """
-    first = Event.query.first()
-    if not first:
-        return 0
+    rows = db.session.query(
+        ComplianceMapping.event_type,
+        ComplianceMapping.standard,
+        ComplianceMapping.control_id,
+        ComplianceMapping.title
+    ).all()
+    preload_mappings(rows)
+    return len(rows)
 
-    created = 0
-    db_events = Event.query.all()
 
-    for ev in db_events:
-        existing = Incident.query.filter_by(event_id_fk=ev.id).first()
-        if existing:
-            continue
+# -----------------------
+# Incident auto-creation
+# -----------------------
+def incident_row_for_event(event_pk, verdict):
+    """
+    Incident row (for Incident.__table__.insert()) for an event whose verdict
+    asks for one, or None.
+    """
+    if not (verdict["policy_result"]["is_violation"] and verdict["incident"].get("create_incident")):
+        return None
 
-        e_dict = {
-            "event_id": ev.event_id,
-            "timestamp": ev.timestamp,
-            "device_type": ev.device_type,
-            "zone": ev.zone,
-            "event_type": ev.event_type,
-            "severity": ev.severity,
-            "summary": ev.summary
-        }
+    return {
+        "incident_type": verdict["incident"].get("incident_type") or "UNSPECIFIED",
+        "status": "open",
+        "event_id_fk": event_pk
+    }
 
-        proc = evaluate_event(e_dict)
 
-        if proc["policy_result"]["is_violation"] and proc["incident"].get("create_incident"):
-            inc = Incident(
-                incident_type=proc["incident"].get("incident_type") or "UNSPECIFIED",
-                status="open",
-                event_id_fk=ev.id
-            )
-            db.session.add(inc)
-            created += 1
+def sync_incidents_from_events():
+    """
+    Backfill incidents for any DB events that are violations but have none
+    (e.g. rows stored before incidents were created at ingest).
+    Safe to call multiple times (no duplicates).
+    """
+    # Reuse the snapshot's rule results instead of re-evaluating every event
+    store = get_event_store()
+    candidates = [
+        row for row in map(incident_row_for_event, store.pks, store.results)
+        if row is not None
+    ]
+    if not candidates:
+        return 0
 
-    if created > 0:
+    # One query for existing incidents instead of one lookup per event
+    existing_fks = {fk for (fk,) in db.session.query(Incident.event_id_fk).all()}
+    new_incidents = [row for row in candidates if row["event_id_fk"] not in existing_fks]
+
+    if new_incidents:
+        # executemany INSERT; no ORM objects needed for fire-and-forget rows
+        db.session.execute(Incident.__table__.insert(), new_incidents)
         db.session.commit()
+        # cached snapshot views include the incident widget
+        invalidate_events_cache()
 
-    return created
+    return len(new_incidents)
 
 
 def get_incident_widget_data(limit=5):
@@ -198,6 +594,7 @@ def get_incident_widget_data(limit=5):
 
     recent = (
         Incident.query
+        .options(joinedload(Incident.event))
         .order_by(Incident.created_at.desc())
         .limit(limit)
         .all()
@@ -217,54 +614,188 @@ def get_incident_widget_data(limit=5):
     return open_count, recent_list
 
 
+def build_incident_widget(store):
+    # Incidents only change on ingest, sync or reset, which all bump the
+    # events version, so the widget can live on the snapshot like the stats.
+    return get_incident_widget_data(limit=5)
+
+
 # -----------------------
 # MQTT ingestion helpers
 # -----------------------
-def _upsert_device_for_event(e: dict):
-    device_key = f"{e.get('device_type', 'UNKNOWN')}_{e.get('zone', 'UNKNOWN')}"
-    device = Device.query.filter_by(device_id=device_key).first()
-
-    if not device:
-        device = Device(
+def _upsert_device(device_key, e: dict):
+    """Insert the device or bump its last_seen, in one statement. Returns the device PK."""
+    stmt = (
+        sqlite_insert(Device)
+        .values(
             device_id=device_key,
             device_type=e.get("device_type", "UNKNOWN"),
             zone=e.get("zone", "UNKNOWN"),
             status="active",
             last_seen=e.get("timestamp")
         )
-        db.session.add(device)
-        db.session.flush()
-    else:
-        device.last_seen = e.get("timestamp")
-
-    return device
-
-
-def _insert_event_to_db(e: dict):
-    eid = e.get("event_id")
-    if not eid:
-        return False
-
-    exists = Event.query.filter_by(event_id=eid).first()
-    if exists:
-        return False
-
-    device = _upsert_device_for_event(e)
-
-    ev = Event(
-        event_id=eid,
-        device_id_fk=device.id,
-        timestamp=e.get("timestamp", ""),
-        device_type=e.get("device_type", ""),
-        zone=e.get("zone", ""),
-        event_type=e.get("event_type", ""),
-        severity=e.get("severity", ""),
-        summary=e.get("summary", ""),
-        payload_json=json.dumps(e, ensure_ascii=False)
+        .on_conflict_do_update(index_elements=[Device.device_id], set_={"last_seen": e.get("timestamp")})
     )
-    db.session.add(ev)
-    db.session.commit()
-    return True
+    if SQLITE_HAS_RETURNING:
+        return db.session.execute(stmt.returning(Device.id)).scalar_one()
+
+    db.session.execute(stmt)
+    return db.session.query(Device.id).filter_by(device_id=device_key).scalar()
+
+
+def _device_key(e: dict):
+    return f"{e.get('device_type', 'UNKNOWN')}_{e.get('zone', 'UNKNOWN')}"
+
+
+def _prepare_event(eid, e: dict):
+    """
+    Rule verdict and Event row (minus device_id_fk) for an incoming event.
+    Raises on events the rules or the serializer can't handle.
+    """
+    verdict = evaluate_event(e)
+    row = {
+        **verdict_to_columns(verdict),
+        "event_id": eid,
+        "timestamp": e.get("timestamp", ""),
+        "device_type": e.get("device_type", ""),
+        "zone": e.get("zone", ""),
+        "event_type": e.get("event_type", ""),
+        "severity": e.get("severity", ""),
+        "summary": e.get("summary", ""),
+        "payload_json": orjson.dumps(e).decode()
+    }
+    return verdict, row
+
+
+def _store_events(prepared):
+    """
+    Upsert the devices, insert the events and their incidents for a list of
+    (event, verdict, row) from _prepare_event. The caller commits.
+    Returns the number of events inserted.
+    """
+    # One upsert per distinct device; the last event in the batch sets last_seen
+    last_event_per_device = {_device_key(e): e for e, _, _ in prepared}
+    device_pks = {key: _upsert_device(key, e) for key, e in last_event_per_device.items()}
+
+    verdicts = {}
+    rows = []
+    for e, verdict, row in prepared:
+        verdicts[row["event_id"]] = verdict
+        rows.append({**row, "device_id_fk": device_pks[_device_key(e)]})
+
+    # ON CONFLICT DO NOTHING still covers a concurrent writer; only the
+    # rows that actually went in come back
+    inserted = bulk_insert_events(rows)
+
+    incident_rows = [
+        row for row in (incident_row_for_event(pk, verdicts[eid]) for pk, eid in inserted)
+        if row is not None
+    ]
+    if incident_rows:
+        db.session.execute(Incident.__table__.insert(), incident_rows)
+    return len(inserted)
+
+
+def _insert_events(events):
+    """
+    Store a batch of incoming events in a single transaction.
+    Events without an event_id, repeats within the batch and events already
+    in the DB are skipped. A malformed event is logged and skipped without
+    losing the rest of the batch. Returns the number of events stored.
+    """
+    new_events = {}
+    for e in events:
+        eid = e.get("event_id")
+        if not eid:
+            continue
+        # event_id is a TEXT column: numbers would be stored (and returned)
+        # as their text, so key everything by that text up front
+        if isinstance(eid, (int, float)) and not isinstance(eid, bool):
+            eid = str(eid)
+        elif not isinstance(eid, str):
+            print(f"[MQTT] Skipping event with invalid event_id: {eid!r}")
+            continue
+        if eid not in new_events:
+            new_events[eid] = e
+    if not new_events:
+        return 0
+
+    existing = {
+        eid for (eid,) in
+        db.session.query(Event.event_id).filter(Event.event_id.in_(list(new_events)))
+    }
+
+    prepared = []
+    for eid, e in new_events.items():
+        if eid in existing:
+            continue
+        try:
+            verdict, row = _prepare_event(eid, e)
+        except Exception as ex:
+            print(f"[MQTT] Skipping malformed event {eid!r}: {ex}")
+            continue
+        prepared.append((e, verdict, row))
+    if not prepared:
+        return 0
+
+    try:
+        stored = _store_events(prepared)
+        db.session.commit()
+    except Exception as ex:
+        # A single bad row (e.g. NULL in a NOT NULL column) fails the whole
+        # executemany; retry one event per savepoint so only that one is lost
+        db.session.rollback()
+        print(f"[MQTT] Batch insert failed, retrying one by one: {ex.__class__.__name__}")
+        stored = 0
+        for item in prepared:
+            try:
+                with db.session.begin_nested():
+                    stored += _store_events([item])
+            except Exception as ex:
+                print(f"[MQTT] Skipping event {item[2]['event_id']!r}: {getattr(ex, 'orig', ex)}")
+        db.session.commit()
+
+    if stored:
+        invalidate_events_cache()
+    return stored
+
+
+def _ingest_worker():
+    """
+    Drain the ingest queue in batches of up to MQTT_BATCH_SIZE messages or
+    MQTT_BATCH_WAIT seconds, whichever comes first, one commit per batch.
+    Payloads are parsed here rather than on paho's network thread.
+    """
+    while True:
+        batch = [_ingest_queue.get()]
+        deadline = time.monotonic() + MQTT_BATCH_WAIT
+        while len(batch) < MQTT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_ingest_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        events = []
+        for payload in batch:
+            try:
+                e = loads_json(payload)
+            except json.JSONDecodeError as ex:
+                print("[MQTT] Error processing message:", ex)
+                continue
+            if not isinstance(e, dict):
+                print("[MQTT] Error processing message: payload is not a JSON object:", type(e).__name__)
+                continue
+            events.append(e)
+
+        try:
+            with app.app_context():
+                stored = _insert_events(events)
+            print(f"[MQTT] Stored {stored}/{len(batch)} event(s) (rest duplicate/invalid)")
+        except Exception as ex:
+            print("[MQTT] Error storing batch:", ex)
 
 
 # -----------------------
@@ -289,19 +820,9 @@ def start_mqtt_subscriber():
         print(f"[MQTT] Disconnected rc={rc}")
 
     def on_message(client, userdata, msg):
-        try:
-            payload = msg.payload.decode("utf-8")
-            e = json.loads(payload)
-
-            with app.app_context():
-                inserted = _insert_event_to_db(e)
-                if inserted:
-                    created = sync_incidents_from_events()
-                    print(f"[MQTT] Stored event_id={e.get('event_id')} (incidents created={created})")
-                else:
-                    print(f"[MQTT] Duplicate/invalid event ignored: {e.get('event_id')}")
-        except Exception as ex:
-            print("[MQTT] Error processing message:", ex)
+        # Keep the network thread free: hand the raw bytes to the ingest
+        # worker. Blocks only if the queue is full (backpressure).
+        _ingest_queue.put(msg.payload)
 
     def run():
         client = mqtt.Client(
@@ -323,6 +844,7 @@ def start_mqtt_subscriber():
         print("[MQTT] connect() called, entering loop_forever() ...")
         client.loop_forever()
 
+    threading.Thread(target=_ingest_worker, daemon=True).start()
     t = threading.Thread(target=run, daemon=True)
     t.start()
     print("[MQTT] Subscriber thread started.")
@@ -337,16 +859,13 @@ def home():
 
 @app.route("/dashboard")
 def dashboard():
-    sync_incidents_from_events()
+    stats, zone_breakdown = get_snapshot_view("dashboard", compute_dashboard_view)
+    zone_rows = build_zone_rows(zone_breakdown, threshold=THRESHOLD)
 
-    events = get_events_source()
-    stats = compute_dashboard_stats(events)
-    zone_rows = build_zone_rows(events, threshold=THRESHOLD)
+    top_event_types = heapq.nlargest(5, stats["event_type_counts"].items(), key=itemgetter(1))
+    top_zones = heapq.nlargest(5, stats["zone_counts"].items(), key=itemgetter(1))
 
-    top_event_types = sorted(stats["event_type_counts"].items(), key=lambda x: x[1], reverse=True)[:5]
-    top_zones = sorted(stats["zone_counts"].items(), key=lambda x: x[1], reverse=True)[:5]
-
-    open_incidents_count, recent_incidents = get_incident_widget_data(limit=5)
+    open_incidents_count, recent_incidents = get_snapshot_view("incident_widget", build_incident_widget)
 
     return render_template(
         "dashboard.html",
@@ -362,12 +881,11 @@ def dashboard():
 
 @app.route("/events")
 def events_page():
-    events = get_events_source()
+    store = get_event_store()
 
     enriched = []
-    for e in events:
-        result = evaluate_event(e)
-        status = "VIOLATION" if result["policy_result"]["is_violation"] else "COMPLIANT"
+    for e, is_violation in zip(store.events, store.is_violation):
+        status = "VIOLATION" if is_violation else "COMPLIANT"
         enriched.append({**e, "compliance_status": status})
 
     return render_template("events.html", events=enriched)
@@ -375,89 +893,90 @@ def events_page():
 
 @app.route("/violations")
 def violations_page():
-    sync_incidents_from_events()
-    events = get_events_source()
-    violations_only = build_violations_list(events)
+    violations_only = get_snapshot_view("violations", build_violations_list)
     return render_template("violations.html", violations=violations_only)
 
 
 @app.route("/event/<event_id>")
 def event_detail(event_id):
-    events = get_events_source()
-    target = next((e for e in events if e.get("event_id") == event_id), None)
+    ev = Event.query.filter_by(event_id=event_id).first()
 
-    if target is None:
+    if ev is None:
         return render_template("event_detail.html", found=False, event_id=event_id)
 
-    processed = evaluate_event(target)
+    target = event_to_dict(ev)
+    processed = verdict_from_columns(ev) or evaluate_event(target["payload"] or target)
     return render_template("event_detail.html", found=True, raw=target, proc=processed)
 
 
 # -----------------------
 # Report download (CSV)
 # -----------------------
+class _CSVLine:
+    """File-like target for csv.writer: writerow() returns the formatted line."""
+
+    def write(self, value):
+        return value
+
+
 @app.route("/report.csv")
 def report_csv():
-    events = get_events_source()
-    stats = compute_dashboard_stats(events)
-    zone_rows = build_zone_rows(events, threshold=THRESHOLD)
-    violations = build_violations_list(events)
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow(["GRSee Audit Report (Prototype)"])
-    writer.writerow(["Generated at", datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
-    writer.writerow(["Threshold (%)", THRESHOLD])
-    writer.writerow([])
-
-    writer.writerow(["Summary"])
-    writer.writerow(["Total events", stats["total"]])
-    writer.writerow(["Compliant events", stats["compliant_count"]])
-    writer.writerow(["Violation events", stats["violations_count"]])
-    writer.writerow(["Compliance (%)", stats["compliance_percent"]])
-    writer.writerow(["Violation (%)", stats["violation_percent"]])
-    writer.writerow([])
-
-    writer.writerow(["Compliance by Zone"])
-    writer.writerow(["Zone", "Total Events", "Violations", "Compliance (%)", "Status"])
-    for z in zone_rows:
-        writer.writerow([z["zone"], z["total"], z["violations"], z["compliance_percent"], z["status"]])
-    writer.writerow([])
-
-    writer.writerow(["Violations"])
-    writer.writerow(["Event ID", "Timestamp", "Zone", "Device", "Event Type", "Severity",
-                     "Policy", "Reason", "ISO Controls", "PCI Requirements", "Incident Suggested"])
-
-    for v in violations:
-        raw = v["raw"]
-        proc = v["proc"]
-        iso_controls = "; ".join(
-            [f'{c.get("control_id")} {c.get("title")}' for c in proc["compliance_mapping"]["iso27001_controls"]]
-        )
-        pci_reqs = "; ".join(
-            [f'{r.get("requirement_id")} {r.get("title")}' for r in proc["compliance_mapping"]["pcidss_requirements"]]
-        )
+    stats, zone_breakdown = get_snapshot_view("dashboard", compute_dashboard_view)
+    zone_rows = build_zone_rows(zone_breakdown, threshold=THRESHOLD)
+    violations = get_snapshot_view("violations", build_violations_list)
+
+    def generate():
+        writer = csv.writer(_CSVLine())
+
+        yield writer.writerow(["GRSee Audit Report (Prototype)"])
+        yield writer.writerow(["Generated at", datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
+        yield writer.writerow(["Threshold (%)", THRESHOLD])
+        yield writer.writerow([])
+
+        yield writer.writerow(["Summary"])
+        yield writer.writerow(["Total events", stats["total"]])
+        yield writer.writerow(["Compliant events", stats["compliant_count"]])
+        yield writer.writerow(["Violation events", stats["violations_count"]])
+        yield writer.writerow(["Compliance (%)", stats["compliance_percent"]])
+        yield writer.writerow(["Violation (%)", stats["violation_percent"]])
+        yield writer.writerow([])
+
+        yield writer.writerow(["Compliance by Zone"])
+        yield writer.writerow(["Zone", "Total Events", "Violations", "Compliance (%)", "Status"])
+        for z in zone_rows:
+            yield writer.writerow([z["zone"], z["total"], z["violations"], z["compliance_percent"], z["status"]])
+        yield writer.writerow([])
+
+        yield writer.writerow(["Violations"])
+        yield writer.writerow(["Event ID", "Timestamp", "Zone", "Device", "Event Type", "Severity",
+                               "Policy", "Reason", "ISO Controls", "PCI Requirements", "Incident Suggested"])
+
+        for v in violations:
+            raw = v["raw"]
+            proc = v["proc"]
+            iso_controls = "; ".join(
+                [f'{c.get("control_id")} {c.get("title")}' for c in proc["compliance_mapping"]["iso27001_controls"]]
+            )
+            pci_reqs = "; ".join(
+                [f'{r.get("requirement_id")} {r.get("title")}' for r in proc["compliance_mapping"]["pcidss_requirements"]]
+            )
 
-        writer.writerow([
-            raw.get("event_id"),
-            raw.get("timestamp"),
-            raw.get("zone"),
-            raw.get("device_type"),
-            raw.get("event_type"),
-            raw.get("severity"),
-            proc["policy_result"].get("policy_name"),
-            proc["policy_result"].get("reason"),
-            iso_controls,
-            pci_reqs,
-            proc["incident"].get("incident_type") if proc["incident"].get("create_incident") else ""
-        ])
-
-    csv_data = output.getvalue()
-    output.close()
+            yield writer.writerow([
+                raw.get("event_id"),
+                raw.get("timestamp"),
+                raw.get("zone"),
+                raw.get("device_type"),
+                raw.get("event_type"),
+                raw.get("severity"),
+                proc["policy_result"].get("policy_name"),
+                proc["policy_result"].get("reason"),
+                iso_controls,
+                pci_reqs,
+                proc["incident"].get("incident_type") if proc["incident"].get("create_incident") else ""
+            ])
 
     return Response(
-        csv_data,
+        stream_with_context(generate()),
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment;filename=grsee_audit_report.csv"}
     )
@@ -470,30 +989,35 @@ def report_csv():
 def init_db():
     with app.app_context():
         db.create_all()
-    return "DB initialized (tables created)."
+        load_compliance_mappings()
+        added, verdicts = migrate_db()
+        created = sync_incidents_from_events()
+    return (
+        f"DB initialized (tables created, columns added={len(added)}, "
+        f"verdicts backfilled={verdicts}, incidents backfilled={created})."
+    )
 
 # -----------------------
 # API Endpoints (MVP)
 # -----------------------
 @app.route("/api/events", methods=["GET"])
 def api_events():
-    limit = int(request.args.get("limit", "100"))
-    events = get_events_source()[:limit]
+    limit = min(max(request.args.get("limit", 100, type=int), 0), API_EVENTS_MAX_LIMIT)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    events = get_events_source_limited(limit, offset)
     return jsonify({"count": len(events), "events": events})
 
 
 @app.route("/api/dashboard", methods=["GET"])
 def api_dashboard():
-    events = get_events_source()
-    stats = compute_dashboard_stats(events)
-    zone_rows = build_zone_rows(events, threshold=THRESHOLD)
+    stats, zone_breakdown = get_snapshot_view("dashboard", compute_dashboard_view)
+    zone_rows = build_zone_rows(zone_breakdown, threshold=THRESHOLD)
     return jsonify({"stats": stats, "zone_rows": zone_rows, "threshold": THRESHOLD})
 
 
 @app.route("/api/violations", methods=["GET"])
 def api_violations():
-    events = get_events_source()
-    violations = build_violations_list(events)
+    violations = get_snapshot_view("violations", build_violations_list)
 
     out = []
     for v in violations:
@@ -510,7 +1034,12 @@ def api_violations():
 
 @app.route("/api/incidents", methods=["GET"])
 def api_incidents():
-    incidents = Incident.query.order_by(Incident.created_at.desc()).all()
+    incidents = (
+        Incident.query
+        .options(joinedload(Incident.event))
+        .order_by(Incident.created_at.desc())
+        .all()
+    )
     out = []
     for i in incidents:
         out.append({
@@ -528,6 +1057,7 @@ def admin_reset():
     Event.query.delete()
     Device.query.delete()
     db.session.commit()
+    invalidate_events_cache()
     return "Reset complete: cleared Device, Event, Incident."
 
 
@@ -537,6 +1067,10 @@ def admin_reset():
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        # Mappings first, so backfilled verdicts use the DB mappings too
+        load_compliance_mappings()
+        migrate_db()
+        sync_incidents_from_events()
 
     start_mqtt_subscriber()
     app.run(debug=True, use_reloader=False)
@@ -1,63 +1,77 @@
-import json
+import socket
 import time
 import random
-import uuid
+import secrets
 from datetime import datetime
+import orjson
 import paho.mqtt.client as mqtt
 
 BROKER_HOST = "127.0.0.1"
 BROKER_PORT = 1883
 TOPIC = "grsee/events"
-
-ZONES = ["SERVER_ROOM", "LOBBY", "CASH_VAULT"]
+BATCH_SIZE = 64        # events published back-to-back per burst
+PUBLISH_INTERVAL = 2   # seconds between bursts
+MAX_INFLIGHT = 100     # unacked QoS 1 messages; paho's default of 20 stalls a burst
+
+# Module-level generator; build_event calls its bound choice() directly
+_rng = random.Random()
+_choice = _rng.choice
+
+# event_id = per-run random prefix + build_event's counter; unique across
+# runs without an os.urandom() call per event
+_EVENT_ID_PREFIX = f"mqtt_evt_{secrets.token_hex(6)}"
+
+ZONES = ("SERVER_ROOM", "LOBBY", "CASH_VAULT")
+
+# event_type -> (device_type, severity)
+EVENT_TEMPLATES = {
+    "MOTION_DETECTED": ("PIR", "MEDIUM"),
+    "RFID_ACCESS_GRANTED": ("RFID", "MEDIUM"),
+    "RFID_ACCESS_DENIED": ("RFID", "HIGH"),
+    "TEMP_THRESHOLD_EXCEEDED": ("TEMP", "HIGH"),
+    "CAMERA_TAMPER_DETECTED": ("CAMERA", "CRITICAL")
+}
+EVENT_TYPES = tuple(EVENT_TEMPLATES)
+
+# event_type -> fn(zone) returning the type-specific extra fields
+EVENT_SAMPLERS = {
+    "RFID_ACCESS_DENIED": lambda zone: {"denied_attempts": _choice((1, 2, 3, 4))},
+    "TEMP_THRESHOLD_EXCEEDED": lambda zone: {
+        "temperature": _choice((31.0, 33.5, 35.0)) if zone == "SERVER_ROOM" else _choice((24.0, 25.0))
+    }
+}
 
 def now_ts():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 def build_event(i: int):
-    zone = random.choice(ZONES)
-    event_type = random.choice([
-        "MOTION_DETECTED",
-        "RFID_ACCESS_GRANTED",
-        "RFID_ACCESS_DENIED",
-        "TEMP_THRESHOLD_EXCEEDED",
-        "CAMERA_TAMPER_DETECTED"
-    ])
+    zone = _choice(ZONES)
+    event_type = _choice(EVENT_TYPES)
+    device_type, severity = EVENT_TEMPLATES[event_type]
 
     base = {
-        "event_id": f"mqtt_evt_{uuid.uuid4()}",
+        "event_id": f"{_EVENT_ID_PREFIX}{i:016x}",
         "timestamp": now_ts(),
-        "device_type": "MQTT_SIM",
+        "device_type": device_type,
         "zone": zone,
         "event_type": event_type,
-        "severity": "LOW",
+        "severity": severity,
         "summary": f"{event_type} detected in {zone}"
     }
 
-    if event_type == "RFID_ACCESS_DENIED":
-        base["device_type"] = "RFID"
-        base["severity"] = "HIGH"
-        base["denied_attempts"] = random.choice([1, 2, 3, 4])
-
-    if event_type == "RFID_ACCESS_GRANTED":
-        base["device_type"] = "RFID"
-        base["severity"] = "MEDIUM"
-
-    if event_type == "TEMP_THRESHOLD_EXCEEDED":
-        base["device_type"] = "TEMP"
-        base["severity"] = "HIGH"
-        base["temperature"] = random.choice([31.0, 33.5, 35.0]) if zone == "SERVER_ROOM" else random.choice([24.0, 25.0])
-
-    if event_type == "CAMERA_TAMPER_DETECTED":
-        base["device_type"] = "CAMERA"
-        base["severity"] = "CRITICAL"
-
-    if event_type == "MOTION_DETECTED":
-        base["device_type"] = "PIR"
-        base["severity"] = "MEDIUM"
+    sampler = EVENT_SAMPLERS.get(event_type)
+    if sampler is not None:
+        base.update(sampler(zone))
 
     return base
 
+def on_connect(client, userdata, flags, rc):
+    # Small payloads sent in bursts: don't let Nagle hold them back waiting
+    # for PUBACKs. Set per connection, since reconnects open a new socket.
+    sock = client.socket()
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
 def main():
     # UNIQUE client_id prevents rc=7 disconnects from Mosquitto
     client = mqtt.Client(
@@ -65,6 +79,8 @@ def main():
         protocol=mqtt.MQTTv311,
         callback_api_version=mqtt.CallbackAPIVersion.VERSION1
     )
+    client.on_connect = on_connect
+    client.max_inflight_messages_set(MAX_INFLIGHT)
 
     client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
     client.loop_start()
@@ -74,12 +90,29 @@ def main():
     i = 0
     try:
         while True:
-            event = build_event(i)
-            payload = json.dumps(event)
-            client.publish(TOPIC, payload, qos=1)
-            print("[PUBLISHER] Sent:", payload)
-            i += 1
-            time.sleep(2)
+            # Built right before publishing so timestamps match send time;
+            # bytes, which paho publishes as-is
+            batch = [orjson.dumps(build_event(n)) for n in range(i, i + BATCH_SIZE)]
+            i += BATCH_SIZE
+            for payload in batch:
+                info = client.publish(TOPIC, payload, qos=1)
+            # Confirm only the last message of the burst; waiting on each one
+            # would serialize the burst on PUBACK round trips. While the broker
+            # is away, publish() fails and loop_start() keeps reconnecting, so
+            # log and carry on instead of letting wait_for_publish() raise.
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                print(f"[PUBLISHER] Publish failed: {mqtt.error_string(info.rc)}")
+            else:
+                try:
+                    # Returns quietly on timeout; is_published() tells us if it landed
+                    info.wait_for_publish(timeout=10)
+                    if info.is_published():
+                        print(f"[PUBLISHER] Sent {len(batch)} events, last:", batch[-1].decode())
+                    else:
+                        print(f"[PUBLISHER] Publish not confirmed within 10s ({len(batch)} events)")
+                except (RuntimeError, ValueError) as ex:
+                    print("[PUBLISHER] Publish not confirmed:", ex)
+            time.sleep(PUBLISH_INTERVAL)
     except KeyboardInterrupt:
         print("[PUBLISHER] Stopped.")
     finally:
@@ -1,8 +1,16 @@
+import sqlite3
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 db = SQLAlchemy()
 
+# Upserts (ON CONFLICT) need SQLite 3.24+. RETURNING needs 3.35+, which
+# older Raspberry Pi OS / Debian bullseye (3.34) lacks; without it the
+# inserted ids are read back with a SELECT instead.
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
 
 class User(db.Model):
     __tablename__ = "users"
@@ -44,8 +52,46 @@ class Event(db.Model):
     # Store raw payload as JSON string (MVP)
     payload_json = db.Column(db.Text, nullable=True)
 
+    # Rule-engine verdict, stored at ingest so reads don't re-evaluate.
+    # NULL is_violation means the row predates these columns.
+    is_violation = db.Column(db.Boolean, nullable=True)
+    policy_name = db.Column(db.String(64), nullable=True)
+    reason = db.Column(db.String(255), nullable=True)
+    incident_type = db.Column(db.String(64), nullable=True)       # NULL when no incident is suggested
+    compliance_mapping_json = db.Column(db.Text, nullable=True)
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # event_id is already indexed through its unique constraint
+    __table_args__ = (
+        db.Index("ix_events_timestamp_desc", timestamp.desc()),
+        db.Index("ix_events_device_fk", device_id_fk),   # Device.events
+    )
+
+
+def bulk_insert_events(rows):
+    """
+    Insert Event rows (dicts of column values) in one executemany statement.
+    Rows whose event_id already exists are skipped. Returns (id, event_id)
+    for the rows actually inserted; the caller commits.
+    """
+    if not rows:
+        return []
+    stmt = sqlite_insert(Event.__table__).on_conflict_do_nothing(index_elements=["event_id"])
+    if SQLITE_HAS_RETURNING:
+        stmt = stmt.returning(Event.__table__.c.id, Event.__table__.c.event_id)
+        return db.session.execute(stmt, rows).all()
+
+    # No RETURNING: rows inserted now get ids above the current max, and
+    # skipped duplicates keep their older, lower ids
+    max_id = db.session.query(func.max(Event.id)).scalar() or 0
+    db.session.execute(stmt, rows)
+    return (
+        db.session.query(Event.id, Event.event_id)
+        .filter(Event.id > max_id, Event.event_id.in_([row["event_id"] for row in rows]))
+        .all()
+    )
+
 
 class Policy(db.Model):
     __tablename__ = "policies"
@@ -86,6 +132,13 @@ class Incident(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # Dashboard widget and /api/incidents list newest first;
+    # the widget also counts open incidents by status
+    __table_args__ = (
+        db.Index("ix_incidents_created_at", created_at.desc()),
+        db.Index("ix_incidents_status", status, created_at),
+    )
+
 
 class Report(db.Model):
     __tablename__ = "reports"
@@ -1,4 +1,6 @@
+import re
 from datetime import datetime
+from functools import lru_cache
 
 # -----------------------------
 # Business context configuration
@@ -10,140 +12,237 @@ BUSINESS_HOURS_END = 18    # 18:00
 RFID_DENIED_THRESHOLD = 3
 SERVER_TEMP_THRESHOLD = 30.0  # Celsius
 
+# Built-in compliance references, in ComplianceMapping row shape:
+# (event_type, standard, control_id, title)
+DEFAULT_COMPLIANCE_MAPPINGS = (
+    ("RFID_ACCESS_GRANTED", "ISO27001", "A.11.1.2", "Physical entry controls"),
+    ("RFID_ACCESS_DENIED", "ISO27001", "A.11.1.3", "Securing offices, rooms and facilities"),
+    ("TEMP_THRESHOLD_EXCEEDED", "ISO27001", "A.11.2.2", "Supporting utilities"),
+    ("CAMERA_TAMPER_DETECTED", "PCI_DSS", "PCI DSS Req. 9", "Restrict physical access to cardholder data"),
+)
+
 
 # -----------------------------
 # Helper functions
 # -----------------------------
 
+_TIMESTAMP_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2} ([0-9]{2}):([0-9]{2}):([0-9]{2})")
+
+
+@lru_cache(maxsize=1024)
+def _is_valid_date(date_str):
+    # Events share a handful of dates, so the calendar check runs once each
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
 def parse_hour(timestamp_str):
     """
     Extract hour from ISO-like timestamp string.
     Expected format: YYYY-MM-DD HH:MM:SS
+    Anything else (offsets, fractions, missing seconds, bad dates) gives None.
+    A precompiled fullmatch replaces running strptime on every event.
     """
-    try:
-        return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S").hour
-    except Exception:
+    if not isinstance(timestamp_str, str):
+        return None
+    match = _TIMESTAMP_RE.fullmatch(timestamp_str)
+    if match is None:
+        return None
+    hour, minute, second = int(match[1]), int(match[2]), int(match[3])
+    if hour > 23 or minute > 59 or second > 59 or not _is_valid_date(timestamp_str[:10]):
         return None
+    return hour
 
 
 # -----------------------------
-# Core rule evaluation
+# Compliance mapping cache
 # -----------------------------
-
-def evaluate_event(event):
+# event_type -> (iso27001_controls, pcidss_requirements), grouped once so
+# rules don't rebuild the reference dicts on every evaluation.
+_mapping_cache = {}
+
+
+def _group_mappings(rows):
+    """{(event_type, standard): [reference dicts]}; unknown standards are skipped."""
+    grouped = {}
+    for event_type, standard, control_id, title in rows:
+        if standard == "ISO27001":
+            ref = {"control_id": control_id, "title": title}
+        elif standard == "PCI_DSS":
+            ref = {"requirement_id": control_id, "title": title}
+        else:
+            print(f"[RULES] Skipping {event_type} mapping {control_id!r}: unknown standard {standard!r}")
+            continue
+        grouped.setdefault((event_type, standard), []).append(ref)
+    return grouped
+
+
+def preload_mappings(rows=()):
     """
-    Evaluates a single event against predefined compliance rules.
-    Returns a structured decision used by dashboard, reports, incidents.
+    Rebuild the mapping cache used by the rules from the built-in mappings
+    with (event_type, standard, control_id, title) rows merged over them.
+    For each event_type and standard present in rows, those rows replace the
+    built-in references; every other event_type/standard keeps the built-ins.
+    The app calls this with the compliance_mappings table at startup.
     """
+    grouped = _group_mappings(DEFAULT_COMPLIANCE_MAPPINGS)
+    grouped.update(_group_mappings(rows))
+
+    cache = {}
+    for (event_type, standard), refs in grouped.items():
+        iso, pci = cache.setdefault(event_type, ([], []))
+        (pci if standard == "PCI_DSS" else iso).extend(refs)
+
+    global _mapping_cache
+    _mapping_cache = {k: (tuple(iso), tuple(pci)) for k, (iso, pci) in cache.items()}
+
 
-    # Default outcome (COMPLIANT)
-    result = {
+def invalidate_mappings():
+    """Drop DB-loaded mappings and fall back to the built-in ones."""
+    preload_mappings()
+
+
+def _compliance_mapping(event_type):
+    iso, pci = _mapping_cache.get(event_type, ((), ()))
+    return {
+        "iso27001_controls": list(iso),
+        "pcidss_requirements": list(pci)
+    }
+
+
+preload_mappings()
+
+
+# -----------------------------
+# Rules
+# -----------------------------
+# Each rule handles one event_type and returns the full result dict when the
+# event violates it, or None when the event is compliant.
+
+# Default outcome (COMPLIANT). Most events end here, so every compliant event
+# shares this one object instead of allocating its own nested dicts.
+NO_VIOLATION_RESULT = {
+    "policy_result": {
+        "is_violation": False,
+        "policy_name": "NO_VIOLATION",
+        "reason": "Event is within defined policy conditions."
+    },
+    "compliance_mapping": {
+        "iso27001_controls": [],
+        "pcidss_requirements": []
+    },
+    "incident": {
+        "create_incident": False,
+        "incident_type": None
+    }
+}
+
+
+def _violation(event_type, policy_name, reason, incident_type):
+    return {
         "policy_result": {
-            "is_violation": False,
-            "policy_name": "NO_VIOLATION",
-            "reason": "Event is within defined policy conditions."
-        },
-        "compliance_mapping": {
-            "iso27001_controls": [],
-            "pcidss_requirements": []
+            "is_violation": True,
+            "policy_name": policy_name,
+            "reason": reason
         },
+        "compliance_mapping": _compliance_mapping(event_type),
         "incident": {
-            "create_incident": False,
-            "incident_type": None
+            "create_incident": True,
+            "incident_type": incident_type
         }
     }
 
-    event_type = event.get("event_type")
-    zone = event.get("zone")
-    severity = event.get("severity", "").lower()
-    timestamp = event.get("timestamp", "")
-
-    # ==========================================================
-    # RULE 1: RFID access AFTER BUSINESS HOURS
-    # ==========================================================
-    if event_type == "RFID_ACCESS_GRANTED":
-        hour = parse_hour(timestamp)
-        if hour is not None and (hour < BUSINESS_HOURS_START or hour >= BUSINESS_HOURS_END):
-            result["policy_result"] = {
-                "is_violation": True,
-                "policy_name": "AFTER_HOURS_PHYSICAL_ACCESS",
-                "reason": "RFID access occurred outside approved business hours."
-            }
-
-            result["compliance_mapping"]["iso27001_controls"].append({
-                "control_id": "A.11.1.2",
-                "title": "Physical entry controls"
-            })
-
-            result["incident"] = {
-                "create_incident": True,
-                "incident_type": "UNAUTHORISED_PHYSICAL_ACCESS"
-            }
-
-    # ==========================================================
-    # RULE 2: MULTIPLE RFID ACCESS DENIED ATTEMPTS
-    # ==========================================================
-    if event_type == "RFID_ACCESS_DENIED":
-        denied_count = event.get("denied_attempts", 1)
-
-        if denied_count >= RFID_DENIED_THRESHOLD:
-            result["policy_result"] = {
-                "is_violation": True,
-                "policy_name": "SUSPICIOUS_ACCESS_ATTEMPTS",
-                "reason": f"{denied_count} consecutive RFID access denial attempts detected."
-            }
-
-            result["compliance_mapping"]["iso27001_controls"].append({
-                "control_id": "A.11.1.3",
-                "title": "Securing offices, rooms and facilities"
-            })
-
-            result["incident"] = {
-                "create_incident": True,
-                "incident_type": "POTENTIAL_INTRUSION_ATTEMPT"
-            }
-
-    # ==========================================================
-    # RULE 3: SERVER ROOM TEMPERATURE EXCEEDED
-    # ==========================================================
-    if event_type == "TEMP_THRESHOLD_EXCEEDED" and zone == "SERVER_ROOM":
-        temp = event.get("temperature")
-
-        if temp is not None and temp > SERVER_TEMP_THRESHOLD:
-            result["policy_result"] = {
-                "is_violation": True,
-                "policy_name": "ENVIRONMENTAL_CONTROL_FAILURE",
-                "reason": f"Server room temperature exceeded safe threshold ({temp}°C)."
-            }
-
-            result["compliance_mapping"]["iso27001_controls"].append({
-                "control_id": "A.11.2.2",
-                "title": "Supporting utilities"
-            })
-
-            result["incident"] = {
-                "create_incident": True,
-                "incident_type": "ENVIRONMENTAL_RISK"
-            }
-
-    # ==========================================================
-    # RULE 4: CAMERA TAMPERING IN CASH / PAYMENT AREA
-    # ==========================================================
-    if event_type == "CAMERA_TAMPER_DETECTED" and zone == "CASH_VAULT":
-        result["policy_result"] = {
-            "is_violation": True,
-            "policy_name": "SURVEILLANCE_TAMPERING",
-            "reason": "Camera tampering detected in payment-sensitive area."
-        }
 
-        result["compliance_mapping"]["pcidss_requirements"].append({
-            "requirement_id": "PCI DSS Req. 9",
-            "title": "Restrict physical access to cardholder data"
-        })
+def _rule_after_hours_access(event):
+    """RULE 1: RFID access AFTER BUSINESS HOURS"""
+    hour = parse_hour(event.get("timestamp", ""))
+    if hour is None or BUSINESS_HOURS_START <= hour < BUSINESS_HOURS_END:
+        return None
 
-        result["incident"] = {
-            "create_incident": True,
-            "incident_type": "SURVEILLANCE_COMPROMISE"
-        }
+    return _violation(
+        "RFID_ACCESS_GRANTED",
+        "AFTER_HOURS_PHYSICAL_ACCESS",
+        "RFID access occurred outside approved business hours.",
+        "UNAUTHORISED_PHYSICAL_ACCESS"
+    )
+
+
+def _rule_denied_attempts(event):
+    """RULE 2: MULTIPLE RFID ACCESS DENIED ATTEMPTS"""
+    denied_count = event.get("denied_attempts", 1)
+    if denied_count < RFID_DENIED_THRESHOLD:
+        return None
+
+    return _violation(
+        "RFID_ACCESS_DENIED",
+        "SUSPICIOUS_ACCESS_ATTEMPTS",
+        f"{denied_count} consecutive RFID access denial attempts detected.",
+        "POTENTIAL_INTRUSION_ATTEMPT"
+    )
+
+
+def _rule_server_room_temperature(event):
+    """RULE 3: SERVER ROOM TEMPERATURE EXCEEDED"""
+    if event.get("zone") != "SERVER_ROOM":
+        return None
+
+    temp = event.get("temperature")
+    # "not >" rather than "<=" so NaN readings stay compliant, as before
+    if temp is None or not temp > SERVER_TEMP_THRESHOLD:
+        return None
+
+    return _violation(
+        "TEMP_THRESHOLD_EXCEEDED",
+        "ENVIRONMENTAL_CONTROL_FAILURE",
+        f"Server room temperature exceeded safe threshold ({temp}°C).",
+        "ENVIRONMENTAL_RISK"
+    )
+
+
+def _rule_camera_tamper(event):
+    """RULE 4: CAMERA TAMPERING IN CASH / PAYMENT AREA"""
+    if event.get("zone") != "CASH_VAULT":
+        return None
+
+    return _violation(
+        "CAMERA_TAMPER_DETECTED",
+        "SURVEILLANCE_TAMPERING",
+        "Camera tampering detected in payment-sensitive area.",
+        "SURVEILLANCE_COMPROMISE"
+    )
 
-    return result
+
+# event_type -> rule; each event type is checked by at most one rule
+_RULES = {
+    "RFID_ACCESS_GRANTED": _rule_after_hours_access,
+    "RFID_ACCESS_DENIED": _rule_denied_attempts,
+    "TEMP_THRESHOLD_EXCEEDED": _rule_server_room_temperature,
+    "CAMERA_TAMPER_DETECTED": _rule_camera_tamper
+}
+
+
+# -----------------------------
+# Core rule evaluation
+# -----------------------------
+
+def evaluate_event(event):
+    """
+    Evaluates a single event against predefined compliance rules.
+    Returns a structured decision used by dashboard, reports, incidents.
+    Compliant events all get NO_VIOLATION_RESULT, so treat results as read-only.
+    """
+    rule = _RULES.get(event.get("event_type"))
+    result = rule(event) if rule is not None else None
+    return result if result is not None else NO_VIOLATION_RESULT
+
+
+def evaluate_events(events: list[dict]) -> list[dict]:
+    """
+    Evaluates a batch of events, returning results in the same order.
+    Used when the whole event history is (re)loaded at once.
+    """
+    evaluate = evaluate_event
+    return [evaluate(e) for e in events]
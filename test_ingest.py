@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway DB before it is imported
+_DB_DIR = tempfile.mkdtemp()
+os.environ["GRSEE_DATABASE_URI"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+
+import app as grsee  # noqa: E402
+from models import db, Event, Incident  # noqa: E402
+
+
+@pytest.fixture
+def ctx():
+    with grsee.app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield
+        db.session.remove()
+
+
+def _good_events(n=5):
+    # After-hours RFID access: each one is a violation with an incident
+    return [
+        {
+            "event_id": f"good{i}",
+            "timestamp": "2026-01-01 23:00:00",
+            "device_type": "RFID",
+            "zone": "LOBBY",
+            "event_type": "RFID_ACCESS_GRANTED",
+            "severity": "HIGH",
+            "summary": "late access"
+        }
+        for i in range(n)
+    ]
+
+
+def _bad(**fields):
+    return {
+        "event_id": "bad",
+        "timestamp": "2026-01-01 10:00:00",
+        "device_type": "PIR",
+        "zone": "LOBBY",
+        "event_type": "MOTION_DETECTED",
+        "severity": "LOW",
+        **fields
+    }
+
+
+@pytest.mark.parametrize("bad", [
+    _bad(timestamp=None),                                         # NOT NULL at insert
+    _bad(zone=["LOBBY"]),                                         # unbindable parameter
+    _bad(event_type="RFID_ACCESS_DENIED", denied_attempts="5"),   # rule TypeError
+    _bad(event_id=["bad"]),                                       # unhashable event_id
+], ids=["null_timestamp", "list_zone", "str_denied_attempts", "list_event_id"])
+def test_bad_event_does_not_drop_batch(ctx, bad):
+    batch = _good_events()
+    batch.insert(2, bad)
+
+    assert grsee._insert_events(batch) == 5
+    assert sorted(eid for (eid,) in db.session.query(Event.event_id)) == [f"good{i}" for i in range(5)]
+    assert Incident.query.count() == 5
+
+
+def test_numeric_event_id_is_stored_as_text(ctx):
+    batch = _good_events()
+    batch.insert(2, _bad(event_id=5))
+
+    assert grsee._insert_events(batch) == 6
+    assert Event.query.filter_by(event_id="5").count() == 1
+    assert Incident.query.count() == 5
+
+    # Same id again, numeric or text, is a duplicate
+    assert grsee._insert_events([_bad(event_id=5), _bad(event_id="5")]) == 0
+
+
+def test_mixed_batch_with_several_bad_events(ctx):
+    batch = _good_events()
+    batch[1:1] = [
+        _bad(event_id=7),
+        _bad(event_id="null_ts", timestamp=None),
+        _bad(event_id="list_zone", zone=["LOBBY"]),
+    ]
+
+    assert grsee._insert_events(batch) == 6
+    stored = {eid for (eid,) in db.session.query(Event.event_id)}
+    assert stored == {f"good{i}" for i in range(5)} | {"7"}
+    assert Incident.query.count() == 5
+
+
+def test_duplicates_within_and_across_batches(ctx):
+    assert grsee._insert_events(_good_events() + _good_events()) == 5
+    assert grsee._insert_events(_good_events(7)) == 2
+    assert Event.query.count() == 7
+
+
+def test_migrate_db_backfills_legacy_verdicts(ctx):
+    grsee._insert_events(_good_events(2) + [_bad(event_id="ok")])
+    db.session.query(Event).update({Event.is_violation: None})
+    db.session.commit()
+
+    assert grsee.migrate_db() == ([], 3)
+    assert Event.query.filter(Event.is_violation.is_(None)).count() == 0
+    assert Event.query.filter_by(is_violation=True).count() == 2
+    # Nothing left to do on the next start
+    assert grsee.migrate_db() == ([], 0)
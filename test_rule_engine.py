@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from rule_engine import evaluate_event, parse_hour
+
+
+def _strptime_hour(timestamp_str):
+    # parse_hour's original implementation, kept as the reference
+    try:
+        return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S").hour
+    except Exception:
+        return None
+
+
+PARSE_HOUR_CASES = [
+    "2026-01-01 22:00:00",
+    "2026-01-01 00:00:00",
+    "2026-01-01 07:59:59",
+    "2026-01-01 18:00:00",
+    "2026-01-01 23:59:59",
+    "2026-01-01 22:00:00+04:00",
+    "2026-01-01 22:00:00Z",
+    "2026-01-01 22:00:00.5",
+    "2026-01-01 22:00",
+    "2026-01-01T22:00:00",
+    "abcdefghij 22:00:00",
+    "2026-01-01 24:00:00",
+    "2026-01-01 22:60:00",
+    "2026-01-01 22:00:60",
+    "2026-01-01 22:00:61",
+    "2026-13-01 22:00:00",
+    "2026-02-30 22:00:00",
+    "0000-01-01 22:00:00",
+    " 2026-01-01 22:00:00",
+    "2026-01-01 22:00:00\n",
+    "",
+    None,
+    1767304800,
+]
+
+
+def test_parse_hour_matches_strptime():
+    for timestamp_str in PARSE_HOUR_CASES:
+        assert parse_hour(timestamp_str) == _strptime_hour(timestamp_str), timestamp_str
+
+
+def test_server_room_temperature_rule():
+    def is_violation(temperature):
+        event = {"event_type": "TEMP_THRESHOLD_EXCEEDED", "zone": "SERVER_ROOM", "temperature": temperature}
+        return evaluate_event(event)["policy_result"]["is_violation"]
+
+    assert is_violation(30.5)
+    assert is_violation(float("inf"))
+    assert not is_violation(30.0)
+    assert not is_violation(None)
+    assert not is_violation(float("nan"))